@@ -6,6 +6,14 @@ import requests
 import pygame
 import logging
 import time
+import sys
+import argparse
+import threading
+import traceback
+import cProfile
+import uuid
+import websockets
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
@@ -29,6 +37,7 @@ import emoji
 # Load .env
 load_dotenv()
 console = Console()
+logger = logging.getLogger('TexuguitoBot')
 
 def em(emoji_code: str) -> str:
     return emoji.emojize(emoji_code)
@@ -68,9 +77,17 @@ class VisualInterface:
 
 # PointsManager
 class PointsManager:
+    """Saldo de pontos em JSON com um ledger de reservas (hold/commit/refund).
+
+    Todas as operações são síncronas, então são atômicas dentro do event loop.
+    Cada movimentação é anexada ao log de transações (JSONL, só append).
+    """
     def __init__(self, file_path: str = "points.json"):
         self.file_path = Path(file_path)
+        self.ledger_path = self.file_path.with_suffix(".ledger.jsonl")
         self.points = self._load()
+        self.holds: Dict[str, dict] = {}
+        self._ledger = None
 
     def _load(self) -> dict:
         if self.file_path.exists():
@@ -87,6 +104,22 @@ class PointsManager:
         except Exception as e:
             print(f"Erro ao salvar pontos: {e}")
 
+    def _log(self, op: str, user: str, amount: int, hold_id: Optional[str] = None):
+        entry = {"ts": round(time.time(), 3), "op": op, "user": user, "amount": amount,
+                 "hold": hold_id, "saldo": self.points.get(user, 0)}
+        try:
+            # Handle mantido aberto (line-buffered) para não abrir o arquivo a cada movimentação
+            if self._ledger is None:
+                self._ledger = open(self.ledger_path, 'a', encoding='utf-8', buffering=1)
+            self._ledger.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except Exception as e:
+            print(f"Erro ao gravar ledger: {e}")
+
+    def close(self):
+        if self._ledger:
+            self._ledger.close()
+            self._ledger = None
+
     def get_points(self, user: str) -> int:
         return self.points.get(user.lower(), 0)
 
@@ -94,6 +127,7 @@ class PointsManager:
         user = user.lower()
         self.points[user] = self.points.get(user, 0) + amount
         self.save()
+        self._log("add", user, amount)
 
     def remove_points(self, user: str, amount: int) -> bool:
         user = user.lower()
@@ -101,9 +135,42 @@ class PointsManager:
         if current >= amount:
             self.points[user] = current - amount
             self.save()
+            self._log("remove", user, amount)
             return True
         return False
 
+    def hold(self, user: str, amount: int) -> Optional[str]:
+        """Reserva `amount` pontos do usuário. Retorna o id da reserva ou None se não houver saldo."""
+        user = user.lower()
+        current = self.get_points(user)
+        if current < amount:
+            return None
+        hold_id = uuid.uuid4().hex[:12]
+        self.points[user] = current - amount
+        self.holds[hold_id] = {"user": user, "amount": amount}
+        self.save()
+        self._log("hold", user, amount, hold_id)
+        return hold_id
+
+    def commit(self, hold_id: str) -> bool:
+        """Confirma a reserva; os pontos já debitados não voltam mais."""
+        hold = self.holds.pop(hold_id, None)
+        if not hold:
+            return False
+        self._log("commit", hold["user"], hold["amount"], hold_id)
+        return True
+
+    def refund(self, hold_id: str) -> bool:
+        """Cancela a reserva e devolve os pontos ao usuário."""
+        hold = self.holds.pop(hold_id, None)
+        if not hold:
+            return False
+        user = hold["user"]
+        self.points[user] = self.points.get(user, 0) + hold["amount"]
+        self.save()
+        self._log("refund", user, hold["amount"], hold_id)
+        return True
+
 # Env Variables
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
@@ -115,6 +182,16 @@ CHANNEL = os.getenv("CHANNEL", "meketreve").lower()
 POINTS_REWARD = 1
 CHECK_INTERVAL = 60
 FILES_DIR = os.path.join(os.path.dirname(__file__), "files")
+STALL_THRESHOLD = 0.25  # segundos que o loop pode ficar travado antes de logar
+PROFILE_WINDOW = 300  # janela padrão do --profile em segundos
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), "config.json")
+# URLs do EventSub configuráveis para testar contra um servidor local (ex: twitch event websocket start-server)
+EVENTSUB_WS_URL = os.getenv("EVENTSUB_WS_URL", "wss://eventsub.wss.twitch.tv/ws")
+EVENTSUB_API_URL = os.getenv("EVENTSUB_API_URL", "https://api.twitch.tv/helix")
+HELIX_URL = os.getenv("HELIX_URL", "https://api.twitch.tv/helix")
+EVENTSUB_RETRY_DELAY = 5  # segundos antes de reconectar após queda
+REDEMPTION_FLUSH_INTERVAL = 5  # segundos entre lotes de atualização de resgates
+REDEMPTION_BATCH = 50  # máximo de ids por requisição da Helix
 
 class TokenManager:
     """Gerencia a renovação automática de tokens do Twitch"""
@@ -186,6 +263,300 @@ def escanear_audios():
                     audios[nome] = {"path": os.path.join(pasta_path, arquivo), "custo": custo}
     return audios
 
+class StallDetector:
+    """Detecta travamentos do event loop e loga a stack de quem está bloqueando.
+
+    Um callback de heartbeat roda no loop a cada fração do limite; uma thread
+    watchdog mede o atraso em relação ao horário previsto do próximo beat e,
+    se passar do limite, captura o frame atual da thread do loop via
+    sys._current_frames().
+    """
+    def __init__(self, threshold: float = STALL_THRESHOLD):
+        self.threshold = threshold
+        self.loop = None
+        self.loop_thread_id = None
+        self.next_beat = time.monotonic()
+        self.stall_reported = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop, debug: bool = False):
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        if debug:
+            # O modo debug do asyncio loga no logger "asyncio" todo callback mais lento que o limite
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name="StallDetector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _beat(self):
+        self.next_beat = time.monotonic() + self.threshold / 2
+        self.stall_reported = False
+        if not self._stop.is_set():
+            self.loop.call_later(self.threshold / 2, self._beat)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            atraso = time.monotonic() - self.next_beat
+            if atraso < self.threshold or self.stall_reported:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self.stall_reported = True
+            stack = "".join(traceback.format_stack(frame))
+            # markup=False: linhas de código com "[...]" na stack seriam lidas como markup do Rich
+            logger.warning(f"🐢 [STALL] Event loop bloqueado há {atraso:.3f}s. Stack atual:\n{stack}",
+                           extra={"markup": False})
+
+
+class LoopProfiler:
+    """Captura um perfil cProfile da thread do event loop durante uma janela de tempo.
+
+    O arquivo gerado é um pstats padrão, que pode ser aberto com
+    `python -m pstats`, snakeviz ou convertido em flamegraph (flameprof, gprof2dot).
+    """
+    def __init__(self, output: str, window: float = PROFILE_WINDOW):
+        self.output = output
+        self.window = window
+        self.profiler = cProfile.Profile()
+
+    async def run(self):
+        logger.info(f"📈 [PROFILE] Capturando perfil por {self.window}s...")
+        self.profiler.enable()
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.output)
+            logger.info(f"📈 [PROFILE] Perfil salvo em {self.output}")
+
+class SessionRecorder:
+    """Grava o tráfego do chat em JSONL compacto para replay determinístico (replay.py).
+
+    A primeira linha é um cabeçalho com canal, broadcaster e o saldo inicial de
+    pontos. As demais têm `t` (segundos desde o início) e `ev`:
+    - "msg": mensagem ou comando (`u` usuário, `id`, `mod`, `c` conteúdo)
+    - "join"/"part": entrada/saída do chat (`u`)
+    - "chatters": resultado de uma consulta de chatters (`us` lista de usuários)
+    """
+    def __init__(self, file_path: str, points: dict):
+        self.start = time.monotonic()
+        self.file = open(file_path, "w", encoding="utf-8")
+        self._write({
+            "ev": "header", "version": 1, "channel": CHANNEL,
+            "broadcaster_id": BROADCASTER_ID, "started_at": datetime.now().isoformat(),
+            "points": points,
+        })
+
+    def _write(self, data: dict):
+        self.file.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def record(self, ev: str, **dados):
+        self._write({"t": round(time.monotonic() - self.start, 3), "ev": ev, **dados})
+
+    def record_message(self, message):
+        author = message.author
+        self.record("msg", u=author.name, id=str(author.id), mod=bool(author.is_mod), c=message.content)
+
+    def close(self):
+        self.file.close()
+
+
+def carregar_recompensas() -> dict:
+    """Lê o mapa `recompensas_audio` (recompensa -> nome do áudio) do config.json."""
+    if not os.path.exists(CONFIG_FILE): return {}
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get("recompensas_audio", {})
+    except Exception as e:
+        logger.error(f"Erro ao ler config.json: {e}")
+        return {}
+
+
+class EventSubClient:
+    """Cliente EventSub via WebSocket para resgates de pontos do canal.
+
+    `recompensas` mapeia o título ou id da recompensa para o nome de um áudio
+    em files/. Resgates mapeados tocam pelo mesmo pipeline do !p e são marcados
+    FULFILLED (ou CANCELED se o áudio falhar) em lotes periódicos.
+    """
+    SUBSCRIPTION = "channel.channel_points_custom_reward_redemption.add"
+
+    def __init__(self, bot, recompensas: dict, ws_url: str = EVENTSUB_WS_URL,
+                 api_url: str = EVENTSUB_API_URL, helix_url: str = HELIX_URL):
+        self.bot = bot
+        self.recompensas = {str(k).lower(): str(v).lower() for k, v in recompensas.items()}
+        self.ws_url = ws_url
+        self.api_url = api_url
+        self.helix_url = helix_url
+        self.session_id = None
+        # Ids das mensagens já processadas (a Twitch pode reenviar, e há sobreposição no reconnect)
+        self.seen_ids = deque(maxlen=500)
+        self.pending: Dict[tuple, list] = {}
+
+    def _headers(self) -> dict:
+        return {"Client-ID": CLIENT_ID, "Authorization": f"Bearer {TOKEN}"}
+
+    async def run(self):
+        flush_task = asyncio.create_task(self._flush_loop())
+        try:
+            while True:
+                try:
+                    ws, keepalive = await self._connect(self.ws_url)
+                    try:
+                        await self._subscribe()
+                    except BaseException:
+                        # Sessão sem inscrição não recebe nada; fecha e tenta de novo do zero
+                        await ws.close()
+                        raise
+                    await self._listen(ws, keepalive)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"❌ [EVENTSUB] Conexão perdida: {e}")
+                await asyncio.sleep(EVENTSUB_RETRY_DELAY)
+        finally:
+            flush_task.cancel()
+            await self._flush()
+
+    async def _connect(self, url: str):
+        """Abre a conexão e espera o session_welcome. Retorna (ws, keepalive em segundos)."""
+        ws = await websockets.connect(url)
+        try:
+            msg = json.loads(await asyncio.wait_for(ws.recv(), 10))
+            if msg["metadata"]["message_type"] != "session_welcome":
+                raise RuntimeError(f"esperava session_welcome, recebi {msg['metadata']['message_type']}")
+        except BaseException:
+            await ws.close()
+            raise
+        session = msg["payload"]["session"]
+        self.session_id = session["id"]
+        logger.info(f"🔌 [EVENTSUB] Sessão {self.session_id} conectada.")
+        return ws, session.get("keepalive_timeout_seconds") or 10
+
+    async def _listen(self, ws, keepalive):
+        try:
+            while True:
+                # Sem nenhuma mensagem (nem keepalive) dentro do prazo, a conexão é considerada morta
+                raw = await asyncio.wait_for(ws.recv(), keepalive + 5)
+                msg = json.loads(raw)
+                if msg["metadata"]["message_type"] != "session_reconnect":
+                    self._handle(msg)
+                    continue
+
+                # A Twitch manda uma URL nova; a antiga continua entregando eventos até o welcome da nova
+                url = msg["payload"]["session"]["reconnect_url"]
+                logger.info("🔄 [EVENTSUB] Reconexão solicitada pela Twitch.")
+                new_conn = await self._drain_until(ws, self._connect(url))
+                await ws.close()
+                ws, keepalive = new_conn
+        finally:
+            await ws.close()
+
+    async def _drain_until(self, ws, coro):
+        """Continua processando mensagens de `ws` enquanto `coro` não termina."""
+        task = asyncio.create_task(coro)
+        while not task.done():
+            recv = asyncio.create_task(ws.recv())
+            done, _ = await asyncio.wait({task, recv}, return_when=asyncio.FIRST_COMPLETED)
+            if recv not in done:
+                recv.cancel()
+            elif recv.exception() is None:
+                self._handle(json.loads(recv.result()))
+            else:
+                # Conexão antiga fechada: só resta esperar a nova
+                await asyncio.wait({task})
+        return task.result()
+
+    def _handle(self, msg: dict):
+        metadata = msg["metadata"]
+        tipo = metadata["message_type"]
+        if tipo == "session_keepalive":
+            return
+        if metadata["message_id"] in self.seen_ids:
+            return
+        self.seen_ids.append(metadata["message_id"])
+        if tipo == "notification":
+            self._on_redemption(msg["payload"]["event"])
+        elif tipo == "revocation":
+            logger.error(f"❌ [EVENTSUB] Inscrição revogada: {msg['payload']['subscription'].get('status')}")
+
+    def _on_redemption(self, event: dict):
+        reward = event["reward"]
+        nome = self.recompensas.get(reward["id"].lower()) or self.recompensas.get(reward["title"].lower())
+        if not nome:
+            return  # Recompensa sem áudio mapeado: fica na fila do streamer
+        pendente = event.get("status") == "unfulfilled"
+        audio = self.bot.audios_chat.get(nome)
+        if not audio:
+            logger.warning(f"⚠️ [RESGATE] Áudio '{nome}' da recompensa '{reward['title']}' não encontrado.")
+            if pendente: self._queue_status(reward["id"], event["id"], "CANCELED")
+            return
+        logger.info(f"🎁 [RESGATE] {event['user_name']} resgatou '{reward['title']}' -> {nome}")
+        task = asyncio.create_task(self._play_redemption(reward["id"], event["id"], audio["path"], pendente))
+        self.bot.audio_jobs.add(task)
+        task.add_done_callback(self.bot.audio_jobs.discard)
+
+    async def _play_redemption(self, reward_id, redemption_id, path, pendente):
+        try:
+            ok = await self.bot._play_job(path)
+        except Exception as e:
+            logger.error(f"Erro no resgate: {e}")
+            ok = False
+        if pendente:
+            self._queue_status(reward_id, redemption_id, "FULFILLED" if ok else "CANCELED")
+
+    def _queue_status(self, reward_id, redemption_id, status):
+        self.pending.setdefault((reward_id, status), []).append(redemption_id)
+
+    async def _subscribe(self):
+        body = {
+            "type": self.SUBSCRIPTION,
+            "version": "1",
+            "condition": {"broadcaster_user_id": BROADCASTER_ID},
+            "transport": {"method": "websocket", "session_id": self.session_id},
+        }
+        loop = asyncio.get_event_loop()
+        resp = await loop.run_in_executor(None, lambda: requests.post(
+            f"{self.api_url}/eventsub/subscriptions", headers=self._headers(), json=body, timeout=10))
+        if resp.status_code != 202:
+            raise RuntimeError(f"falha na inscrição ({resp.status_code}): {resp.text}")
+        logger.info("✅ [EVENTSUB] Inscrito em resgates de recompensas.")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(REDEMPTION_FLUSH_INTERVAL)
+            await self._flush()
+
+    async def _flush(self):
+        pending, self.pending = self.pending, {}
+        for (reward_id, status), ids in pending.items():
+            for i in range(0, len(ids), REDEMPTION_BATCH):
+                try:
+                    await self._update_redemptions(reward_id, status, ids[i:i + REDEMPTION_BATCH])
+                except Exception as e:
+                    logger.error(f"Erro ao atualizar resgates: {e}")
+
+    async def _update_redemptions(self, reward_id, status, ids):
+        params = [("broadcaster_id", BROADCASTER_ID), ("reward_id", reward_id)] + [("id", i) for i in ids]
+        loop = asyncio.get_event_loop()
+        resp = await loop.run_in_executor(None, lambda: requests.patch(
+            f"{self.helix_url}/channel_points/custom_rewards/redemptions",
+            headers=self._headers(), params=params, json={"status": status}, timeout=10))
+        if resp.status_code == 200:
+            logger.info(f"🎁 [RESGATE] {len(ids)} resgate(s) marcados como {status}.")
+        else:
+            # A Helix só aceita atualizar recompensas criadas pelo mesmo CLIENT_ID
+            logger.error(f"❌ [RESGATE] Falha ao marcar {status} ({resp.status_code}): {resp.text}")
+
+
 class TexuguitoBot(commands.Bot):
     def __init__(self):
         # Em 2.10.0, o token precisa do prefixo oauth:
@@ -208,14 +579,29 @@ class TexuguitoBot(commands.Bot):
         self.raffle_task = None
         self.last_audio_time = 0
 
+        # Relógio usado nos cooldowns (o replay troca pelo relógio virtual do loop)
+        self.clock = time.time
+
+        # Jobs de áudio em andamento; o lock garante um áudio por vez no mixer
+        self.audio_jobs = set()
+        self.audio_lock = asyncio.Lock()
+        self.recorder: Optional[SessionRecorder] = None
+
+        # Resgates de pontos do canal via EventSub (só se houver recompensas mapeadas)
+        recompensas = carregar_recompensas()
+        self.eventsub = EventSubClient(self, recompensas) if recompensas else None
+        self.eventsub_task = None
 
 
     async def event_ready(self):
         logger.info(f"✅ BOT ONLINE NO CANAL: {CHANNEL}")
         asyncio.create_task(self.points_loop())
+        if self.eventsub and not self.eventsub_task:
+            self.eventsub_task = asyncio.create_task(self.eventsub.run())
 
     async def event_message(self, message):
         if message.echo or not message.author: return
+        if self.recorder: self.recorder.record_message(message)
         author = message.author.name
         content = message.content
         
@@ -226,6 +612,12 @@ class TexuguitoBot(commands.Bot):
             
         await self.handle_commands(message)
 
+    async def event_join(self, channel, user):
+        if self.recorder: self.recorder.record("join", u=user.name)
+
+    async def event_part(self, user):
+        if self.recorder: self.recorder.record("part", u=user.name)
+
     @commands.command(name="ping")
     async def ping_cmd(self, ctx):
         await ctx.send(f"🏓 Pong, {ctx.author.name}!")
@@ -243,7 +635,7 @@ class TexuguitoBot(commands.Bot):
         
         # Cooldown de 1 minuto
         cd = 60
-        now = time.time()
+        now = self.clock()
         elapsed = now - self.last_audio_time
         if elapsed < cd:
             restante = int(cd - elapsed)
@@ -253,11 +645,22 @@ class TexuguitoBot(commands.Bot):
         nome = nome.lower()
         if nome in self.audios_chat:
             audio = self.audios_chat[nome]
-            if self.points_manager.remove_points(ctx.author.name, audio['custo']):
-                # Atualiza o timestamp apenas se os pontos forem removidos e o áudio for tocar
+            hold_id = self.points_manager.hold(ctx.author.name, audio['custo'])
+            if hold_id:
+                # Atualiza o timestamp apenas se os pontos forem reservados e o áudio for tocar
+                anterior = self.last_audio_time
                 self.last_audio_time = now
-                await self._play_audio(audio["path"])
-                await ctx.send(f"🔊 Tocando: {nome}. Saldo: {self.points_manager.get_points(ctx.author.name)} pts.")
+
+                def desfazer_cooldown():
+                    # Áudio falhou: libera o !p de novo, a menos que outro áudio já tenha renovado o cooldown
+                    if self.last_audio_time == now:
+                        self.last_audio_time = anterior
+
+                saldo = self.points_manager.get_points(ctx.author.name)
+                self._start_audio_job(ctx, hold_id, self._play_job(audio["path"]),
+                                      f"❌ Erro ao tocar '{nome}'. {audio['custo']} pts devolvidos.",
+                                      on_refund=desfazer_cooldown)
+                await ctx.send(f"🔊 Tocando: {nome}. Saldo: {saldo} pts.")
             else:
                 await ctx.send(f"❌ Pontos insuficientes!")
         else:
@@ -341,40 +744,47 @@ class TexuguitoBot(commands.Bot):
             await ctx.send("❌ Use: !tts <mensagem>")
             return
 
-        if self.points_manager.remove_points(ctx.author.name, CUSTO_TTS):
-            try:
-                # Cria arquivo temporário para o áudio
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                    temp_path = fp.name
-                
-                # Gera o áudio via gTTS (incluindo o nome de quem enviou)
-                texto_completo = f"{ctx.author.name} enviou a mensagem: {texto}"
-                tts = gTTS(text=texto_completo, lang='pt', tld='com.br')
-                tts.save(temp_path)
-                
-                # Toca o áudio
-                await self._play_audio(temp_path)
-                
-                # Garante que o pygame solte o arquivo antes de deletar (WinError 32 fix)
-                try:
-                    pygame.mixer.music.stop()
-                    pygame.mixer.music.unload()
-                except: pass
-                
-                # Pequena pausa para o SO processar a liberação
-                await asyncio.sleep(0.5)
-
-                # Remove o arquivo após tocar
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
-                await ctx.send(f"🎙️ [TTS] {ctx.author.name} enviou uma mensagem! (-{CUSTO_TTS} pts)")
-            except Exception as e:
-                logger.error(f"Erro no TTS: {e}")
-                await ctx.send("❌ Erro ao gerar o TTS.")
+        hold_id = self.points_manager.hold(ctx.author.name, CUSTO_TTS)
+        if hold_id:
+            self._start_audio_job(ctx, hold_id, self._tts_job(ctx, texto, CUSTO_TTS),
+                                  f"❌ Erro ao gerar o TTS. {CUSTO_TTS} pts devolvidos.")
         else:
             await ctx.send(f"❌ Pontos insuficientes ({CUSTO_TTS} pts necessários).")
 
+    async def _tts_job(self, ctx, texto, custo) -> bool:
+        # Cria arquivo temporário para o áudio
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
+            temp_path = fp.name
+
+        # Gera o áudio via gTTS (incluindo o nome de quem enviou) fora do event loop
+        texto_completo = f"{ctx.author.name} enviou a mensagem: {texto}"
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._synthesize_tts, texto_completo, temp_path)
+
+        async with self.audio_lock:
+            # Toca o áudio
+            ok = await self._play_audio(temp_path)
+
+            # Garante que o pygame solte o arquivo antes de deletar (WinError 32 fix)
+            try:
+                pygame.mixer.music.stop()
+                pygame.mixer.music.unload()
+            except: pass
+
+            # Pequena pausa para o SO processar a liberação
+            await asyncio.sleep(0.5)
+
+        # Remove o arquivo após tocar (falha aqui não deve devolver pontos de um TTS que tocou)
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        except Exception as e:
+            logger.error(f"Erro ao remover arquivo do TTS: {e}")
+
+        if ok:
+            await ctx.send(f"🎙️ [TTS] {ctx.author.name} enviou uma mensagem! (-{custo} pts)")
+        return ok
+
     @commands.command(name="stop")
     async def stop_cmd(self, ctx):
         pygame.mixer.music.stop()
@@ -426,7 +836,8 @@ class TexuguitoBot(commands.Bot):
             logger.info("🎁 [SORTEIO] Terminado sem participantes.")
             return
 
-        ganhador = random.choice(list(self.raffle_participants))
+        # Ordena antes de sortear: a ordem de um set muda entre execuções e quebraria o replay com seed fixa
+        ganhador = random.choice(sorted(self.raffle_participants))
         self.points_manager.add_points(ganhador, pontos)
         
         await ctx.send(f"🎊 PARABÉNS @{ganhador}! Você ganhou o sorteio de {pontos} pontos! 🥳")
@@ -441,17 +852,21 @@ class TexuguitoBot(commands.Bot):
         while True:
             await asyncio.sleep(CHECK_INTERVAL)
             try:
-                chatters = await self._get_chatters()
-                current_set = set(chatters)
-                active = self.last_chatters.intersection(current_set)
-                if active:
-                    for u in active: self.points_manager.add_points(u, POINTS_REWARD)
-                    self.ui.log_point_reward(len(active))
-                self.last_chatters = current_set
+                await self._points_tick()
             except Exception as e: logger.error(f"Erro no loop de pontos: {e}")
 
+    async def _points_tick(self):
+        chatters = await self._get_chatters()
+        if self.recorder: self.recorder.record("chatters", us=chatters)
+        current_set = set(chatters)
+        active = self.last_chatters.intersection(current_set)
+        if active:
+            for u in active: self.points_manager.add_points(u, POINTS_REWARD)
+            self.ui.log_point_reward(len(active))
+        self.last_chatters = current_set
+
     async def _get_chatters(self) -> list:
-        url = f"https://api.twitch.tv/helix/chat/chatters?broadcaster_id={BROADCASTER_ID}&moderator_id={BROADCASTER_ID}"
+        url = f"{HELIX_URL}/chat/chatters?broadcaster_id={BROADCASTER_ID}&moderator_id={BROADCASTER_ID}"
         headers = {"Client-ID": CLIENT_ID, "Authorization": f"Bearer {TOKEN}"}
         loop = asyncio.get_event_loop()
         resp = await loop.run_in_executor(None, lambda: requests.get(url, headers=headers))
@@ -459,19 +874,57 @@ class TexuguitoBot(commands.Bot):
             return [u["user_name"].lower() for u in resp.json().get("data", [])]
         return []
 
-    async def _play_audio(self, path):
+    def _synthesize_tts(self, texto, path):
+        tts = gTTS(text=texto, lang='pt', tld='com.br')
+        tts.save(path)
+
+    def _start_audio_job(self, ctx, hold_id, job, msg_falha, on_refund=None):
+        """Roda o job em segundo plano; o comando retorna sem esperar o áudio.
+
+        `on_refund` é chamado se o job falhar, para desfazer efeitos colaterais do comando.
+        """
+        task = asyncio.create_task(self._run_audio_job(ctx, hold_id, job, msg_falha, on_refund))
+        self.audio_jobs.add(task)
+        task.add_done_callback(self.audio_jobs.discard)
+
+    async def _run_audio_job(self, ctx, hold_id, job, msg_falha, on_refund=None):
+        ok = False
+        try:
+            ok = await job
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no job de áudio: {e}")
+        finally:
+            # Também roda se o job for cancelado (ex: desligamento), para a reserva não ficar aberta
+            if ok:
+                self.points_manager.commit(hold_id)
+            else:
+                self.points_manager.refund(hold_id)
+                if on_refund: on_refund()
+        if not ok:
+            await ctx.send(msg_falha)
+
+    async def _play_job(self, path) -> bool:
+        async with self.audio_lock:
+            return await self._play_audio(path)
+
+    async def _play_audio(self, path) -> bool:
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self._play_sync, path)
+        return await loop.run_in_executor(None, self._play_sync, path)
 
-    def _play_sync(self, path):
+    def _play_sync(self, path) -> bool:
         try:
             pygame.mixer.music.load(path)
             pygame.mixer.music.set_volume(self.audio_volume)
             pygame.mixer.music.play()
             while pygame.mixer.music.get_busy(): pygame.time.wait(100)
-        except Exception as e: logger.error(f"Erro Áudio: {e}")
+            return True
+        except Exception as e:
+            logger.error(f"Erro Áudio: {e}")
+            return False
 
-async def main():
+async def main(args):
     ui = VisualInterface()
     ui.show_banner()
     
@@ -486,13 +939,40 @@ async def main():
     try: pygame.mixer.init()
     except: pass
     
+    stall_detector = StallDetector(args.stall_threshold)
+    stall_detector.start(asyncio.get_running_loop(), debug=args.profile)
+    if args.profile:
+        profiler = LoopProfiler(args.profile_out, args.profile_window)
+        asyncio.create_task(profiler.run())
+
     bot = TexuguitoBot()
+    if args.record:
+        bot.recorder = SessionRecorder(args.record, dict(bot.points_manager.points))
+        logger.info(f"⏺️ [RECORD] Gravando sessão em {args.record}")
     ui.show_config_table({"Canal": CHANNEL, "Points": f"{POINTS_REWARD}/min", "Status": "Autenticando..."})
-    await bot.start()
+    try:
+        await bot.start()
+    finally:
+        stall_detector.stop()
+        if bot.recorder: bot.recorder.close()
+        bot.points_manager.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Texuguito Bot")
+    parser.add_argument("--profile", action="store_true",
+                        help="Captura um perfil cProfile e ativa o modo debug do asyncio")
+    parser.add_argument("--profile-window", type=float, default=PROFILE_WINDOW,
+                        help="Duração da captura do perfil em segundos")
+    parser.add_argument("--profile-out", default=f"profile-{datetime.now():%Y%m%d-%H%M%S}.pstats",
+                        help="Arquivo de saída do perfil (formato pstats)")
+    parser.add_argument("--stall-threshold", type=float, default=STALL_THRESHOLD,
+                        help="Tempo em segundos que o loop pode travar antes de logar a stack")
+
+    parser.add_argument("--record", metavar="ARQUIVO",
+                        help="Grava a sessão do chat (JSONL) para replay com replay.py")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger('TexuguitoBot')
     rich_handler = RichHandler(console=console, show_time=True, show_path=False, markup=True)
     logger.addHandler(rich_handler)
-    asyncio.run(main())
+    asyncio.run(main(args))
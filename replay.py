@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import selectors
+import statistics
+import tempfile
+import time
+
+from rich.logging import RichHandler
+from rich.table import Table
+from rich import box
+from twitchio.ext.commands import Context
+
+import bot as texuguito
+from bot import TexuguitoBot, PointsManager, console, logger
+
+# Velocidades aceitas em --speed ("max" = o mais rápido possível)
+SPEEDS = {"1x": 1.0, "10x": 10.0, "max": None}
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector que delega ao loop a conversão do timeout virtual para tempo real."""
+    def __init__(self, loop_ref):
+        super().__init__()
+        self.loop_ref = loop_ref
+
+    def select(self, timeout=None):
+        return self.loop_ref()._select(super().select, timeout)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop com relógio virtual.
+
+    Com `speed` numérico o tempo do loop corre `speed` vezes mais rápido que o
+    real. Com `speed=None` o relógio salta direto para o próximo timer sempre
+    que não há I/O pronto, então sleeps (cooldowns, sorteio, TTS) não custam
+    tempo real.
+
+    Enquanto houver trabalho em `run_in_executor` o relógio não salta: o select
+    bloqueia de verdade até a thread terminar, senão timers venceriam antes de
+    um job que na sessão real acabaria primeiro.
+
+    O relógio começa em 0: com valores do tamanho de um timestamp a resolução
+    do float engole o `_clock_resolution` do asyncio e o timer nunca vence.
+    """
+    def __init__(self, speed=None):
+        self.speed = speed
+        self._real_base = time.monotonic()
+        self._virtual_now = 0.0
+        self._executor_pending = 0
+        super().__init__(_VirtualSelector(lambda: self))
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self._executor_pending += 1
+        future.add_done_callback(self._executor_done)
+        return future
+
+    def _executor_done(self, future):
+        self._executor_pending -= 1
+
+    def time(self):
+        if self.speed is None:
+            return self._virtual_now
+        return (time.monotonic() - self._real_base) * self.speed
+
+    def _select(self, select, timeout):
+        if self.speed is None:
+            if timeout is None or (timeout > 0 and self._executor_pending):
+                return select(None)
+            events = select(0)
+            if not events and timeout > 0:
+                self._virtual_now += timeout
+            return events
+        return select(None if timeout is None else timeout / self.speed)
+
+
+class ReplayChatter:
+    def __init__(self, name, user_id, is_mod):
+        self.name = name
+        self.display_name = name
+        self.id = user_id
+        self.is_mod = is_mod
+        self._ws = None
+
+
+class ReplayChannel:
+    def __init__(self, name):
+        self.name = name
+        self._name = name
+
+
+class ReplayMessage:
+    def __init__(self, event, channel):
+        self.content = event["c"]
+        self.author = ReplayChatter(event["u"], event.get("id"), event.get("mod", False))
+        self.channel = channel
+        self.echo = False
+        self.tags = {}
+
+
+class ReplayContext(Context):
+    """Context que guarda as respostas em vez de enviá-las pelo IRC."""
+    async def send(self, content: str):
+        self.bot.sent.append(content)
+
+    async def reply(self, content: str):
+        self.bot.sent.append(content)
+
+
+class ReplayBot(TexuguitoBot):
+    """TexuguitoBot sem saída de áudio, TTS ou rede, alimentado por uma gravação."""
+    def __init__(self, points_file, audio_duration=0.0):
+        super().__init__()
+        self.points_manager = PointsManager(points_file)
+        self.poll = []
+        self.audio_duration = audio_duration
+        self.sent = []
+        self.tick_latencies = []
+
+    async def get_context(self, message, *, cls=None):
+        return await super().get_context(message, cls=cls or ReplayContext)
+
+    async def _points_tick(self):
+        inicio = time.perf_counter()
+        await super()._points_tick()
+        self.tick_latencies.append(time.perf_counter() - inicio)
+
+    async def _get_chatters(self) -> list:
+        return self.poll
+
+    def _synthesize_tts(self, texto, path):
+        pass
+
+    async def _play_audio(self, path) -> bool:
+        await asyncio.sleep(self.audio_duration)
+        return True
+
+
+def load_recording(path):
+    with open(path, "r", encoding="utf-8") as f:
+        linhas = [json.loads(line) for line in f if line.strip()]
+    if not linhas or linhas[0].get("ev") != "header":
+        raise ValueError(f"{path} não é uma gravação válida (cabeçalho ausente)")
+    return linhas[0], linhas[1:]
+
+
+def latency_stats(amostras):
+    if not amostras:
+        return {"count": 0}
+    ordenadas = sorted(amostras)
+    def pct(p):
+        return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000
+    return {
+        "count": len(ordenadas),
+        "mean_ms": statistics.fmean(ordenadas) * 1000,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": ordenadas[-1] * 1000,
+    }
+
+
+async def replay(header, events, points_file, audio_duration):
+    # A gravação define quem é o broadcaster (permissões de !sorteio/!addpoints)
+    texuguito.BROADCASTER_ID = header.get("broadcaster_id")
+    loop = asyncio.get_running_loop()
+
+    bot = ReplayBot(points_file, audio_duration)
+    bot.points_manager.points = dict(header.get("points", {}))
+    # Cooldowns comparam com last_audio_time=0, então o relógio do bot precisa parecer um timestamp
+    epoch = time.time()
+    bot.clock = lambda: epoch + loop.time()
+    channel = ReplayChannel(header.get("channel", texuguito.CHANNEL))
+
+    latencias = {}
+
+    async def feed(event):
+        message = ReplayMessage(event, channel)
+        tipo = event["c"].split()[0].lower() if event["c"].startswith("!") else "chat"
+        inicio = time.perf_counter()
+        await bot.event_message(message)
+        latencias.setdefault(tipo, []).append(time.perf_counter() - inicio)
+
+    inicio_virtual = loop.time()
+    inicio_real = time.perf_counter()
+    tasks = []
+    for event in events:
+        atraso = inicio_virtual + event["t"] - loop.time()
+        if atraso > 0:
+            await asyncio.sleep(atraso)
+        if event["ev"] == "msg":
+            tasks.append(asyncio.create_task(feed(event)))
+        elif event["ev"] == "join":
+            await bot.event_join(channel, ReplayChatter(event["u"], None, False))
+        elif event["ev"] == "part":
+            await bot.event_part(ReplayChatter(event["u"], None, False))
+        elif event["ev"] == "chatters":
+            # Cada tick do loop de pontos roda no instante gravado, na mesma ordem em relação às mensagens
+            bot.poll = event["us"]
+            try:
+                await bot._points_tick()
+            except Exception as e: logger.error(f"Erro no loop de pontos: {e}")
+
+    await asyncio.gather(*tasks)
+    # Os comandos de áudio liberam o handler na hora; espera os jobs fecharem as reservas
+    while bot.audio_jobs:
+        await asyncio.gather(*bot.audio_jobs)
+    if bot.raffle_task:
+        await bot.raffle_task
+    bot.points_manager.close()
+
+    todas = [l for amostras in latencias.values() for l in amostras]
+    return {
+        "events": len(events),
+        "wall_time_s": time.perf_counter() - inicio_real,
+        "virtual_time_s": loop.time() - inicio_virtual,
+        "messages_sent": len(bot.sent),
+        "latency": {
+            "all": latency_stats(todas),
+            "points_tick": latency_stats(bot.tick_latencies),
+            "by_command": {tipo: latency_stats(a) for tipo, a in sorted(latencias.items())},
+        },
+        "points": dict(sorted(bot.points_manager.points.items())),
+    }
+
+
+def show_report(report):
+    table = Table(title="Latência do replay", box=box.ROUNDED)
+    table.add_column("Tipo", style="cyan")
+    for col in ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"):
+        table.add_column(col, style="magenta", justify="right")
+    linhas = [("all", report["latency"]["all"]), ("points_tick", report["latency"]["points_tick"])]
+    linhas += list(report["latency"]["by_command"].items())
+    for tipo, stats in linhas:
+        table.add_row(tipo, str(stats["count"]), *(
+            f"{stats[k]:.2f}" if k in stats else "-" for k in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+        ))
+    console.print(table)
+    console.print(f"⏱️ {report['events']} eventos em {report['wall_time_s']:.2f}s reais "
+                  f"({report['virtual_time_s']:.0f}s virtuais), {report['messages_sent']} respostas no chat.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de uma sessão gravada com bot.py --record")
+    parser.add_argument("recording", help="Arquivo JSONL gravado com --record")
+    parser.add_argument("--speed", choices=SPEEDS.keys(), default="max",
+                        help="Velocidade do replay (padrão: max)")
+    parser.add_argument("--report", help="Salva o relatório em JSON neste arquivo")
+    parser.add_argument("--audio-duration", type=float, default=0.0,
+                        help="Duração simulada (segundos virtuais) de cada áudio tocado")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed do random (sorteios), para runs comparáveis (padrão: 0)")
+    parser.add_argument("--quiet", action="store_true", help="Não mostra os logs do bot")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO)
+    if not args.quiet:
+        logger.addHandler(RichHandler(console=console, show_time=True, show_path=False, markup=True))
+
+    header, events = load_recording(args.recording)
+    random.seed(args.seed)
+    loop = VirtualClockLoop(SPEEDS[args.speed])
+    asyncio.set_event_loop(loop)
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            report = loop.run_until_complete(
+                replay(header, events, os.path.join(tmp, "points.json"), args.audio_duration)
+            )
+        finally:
+            loop.close()
+
+    report["speed"] = args.speed
+    report["seed"] = args.seed
+    show_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        console.print(f"💾 Relatório salvo em {args.report}")
+
+
+if __name__ == "__main__":
+    main()